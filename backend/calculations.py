@@ -1,6 +1,25 @@
 # backend/calculations.py
 import math
 from dataclasses import dataclass
+import numpy as np
+from numba import njit, vectorize
+
+# value-preserving fastmath subset only: no "nnan" (missing soil values reach the kernels
+# as NaN), and no "reassoc"/"arcp"/"contract" so every WF path rounds bit-identically --
+# wf feeds the audit hash
+FASTMATH = {"nsz", "afn"}
+
+# chemically defensible central: 0.33 kg CO2 per kg basalt (depends on CaO+MgO content)
+CO2_PER_KG = 0.33
+# reporting band around the central estimate
+CONS_FACTOR = 0.8
+OPT_FACTOR = 1.15
+# base_rate derived from literature-style tuning (Beerling-like kinetics simplified):
+# baseline max fraction for well-conditioned parameters
+BASE_RATE = 0.18
+# WF clamp: min 0.5% to avoid zero; max 35%
+WF_MIN = 0.005
+WF_MAX = 0.35
 
 @dataclass
 class SoilContext:
@@ -10,27 +29,14 @@ class SoilContext:
     annual_rain: float
     mean_temp: float
 
-def particle_factor(size_mm: float):
+@njit("f8(f8)", cache=True, fastmath=FASTMATH)
+def particle_factor(size_mm):
     size = max(size_mm, 0.05)
     # particles <=0.25mm give near-max factor; larger reduce roughly inverse-proportion
     f = min(0.25 / size, 1.0)
     return f
 
-def pH_factor(pH: float):
-    if pH is None:
-        return 0.8
-    # fastest around neutral 6.5-7.5
-    if pH < 5.5:
-        return 0.4
-    if pH < 6.0:
-        return 0.7
-    if pH <= 7.5:
-        return 1.0
-    return 0.85
-
-def clay_factor(clay: float):
-    if clay is None:
-        return 0.85
+def _clay_steps(clay):
     if clay < 15:
         return 1.0
     if clay < 25:
@@ -39,47 +45,146 @@ def clay_factor(clay: float):
         return 0.75
     return 0.6
 
+# stair-step factors tabulated so the kernels do a load instead of a branch chain
+# pH: <5.5, [5.5,6.0), [6.0,7.5], >7.5 -- fastest around neutral 6.5-7.5
+PH_STEPS = np.array([0.4, 0.7, 1.0, 0.85], dtype=np.float64)
+CLAY_LUT = np.array([_clay_steps(c * 5.0) for c in range(8)], dtype=np.float64)     # 5% bins, 0-35+
+
+@njit("f8(f8)", cache=True, fastmath=FASTMATH)
+def pH_factor(pH):
+    if math.isnan(pH):
+        return 0.8
+    # step index from comparisons keeps the exact (inclusive) 7.5 boundary
+    return PH_STEPS[int(pH >= 5.5) + int(pH >= 6.0) + int(pH > 7.5)]
+
+@njit("f8(f8)", cache=True, fastmath=FASTMATH)
+def clay_factor(clay):
+    if math.isnan(clay):
+        return 0.85
+    return CLAY_LUT[int(min(max(clay / 5.0, 0.0), CLAY_LUT.size - 1.0))]
+
+@njit("f8(f8,f8)", cache=True, fastmath=FASTMATH)
 def climate_factor(rain_mm, temp_c):
     rain_f = min(rain_mm / 1500.0, 1.5)  # tropical cap
     temp_f = min((temp_c + 5.0) / 30.0, 1.4)
     return rain_f * temp_f
 
-def compute_weathering_fraction(soil: SoilContext, particle_size_mm: float):
+@njit("f8(f8,f8,f8,f8,f8)", cache=True, fastmath=FASTMATH)
+def _wf_from_base(base, pH, clay, rain, temp):
+    # single definition of the WF formula + clamp; base = BASE_RATE * particle factor
+    wf = base * pH_factor(pH) * clay_factor(clay) * climate_factor(rain, temp)
+    return max(min(wf, WF_MAX), WF_MIN)
+
+@njit("f8(f8,f8,f8,f8,f8)", cache=True, fastmath=FASTMATH)
+def compute_wf_kernel(pH, clay, rain, temp, particle_size_mm):
+    """
+    Scalar weathering-fraction kernel; pH/clay may be NaN for "unknown".
+    Eagerly compiled on import so the first request doesn't pay the JIT cost.
+    """
+    return _wf_from_base(BASE_RATE * particle_factor(particle_size_mm), pH, clay, rain, temp)
+
+@vectorize(["f8(f8,f8,f8,f8,f8)"], target="parallel", fastmath=FASTMATH, cache=True)
+def wf_ufunc(pH, clay, rain, temp, particle_size_mm):
+    """Array form of compute_wf_kernel (SIMD + multithreaded) for batch recomputation."""
+    return compute_wf_kernel(pH, clay, rain, temp, particle_size_mm)
+
+def _nan_if_none(x):
+    return math.nan if x is None else float(x)
+
+def compute_weathering_fraction(pH, clay_pct, annual_rain, mean_temp, particle_size_mm):
     """
     Produce WF per year (fraction of applied basalt that reacts in 1 year).
     Tuned to produce realistic WF in range ~0.02 - 0.35 for typical inputs.
     """
-    pf = particle_factor(particle_size_mm)
-    phf = pH_factor(soil.pH)
-    cf = clay_factor(soil.clay_pct)
-    climf = climate_factor(soil.annual_rain, soil.mean_temp)
+    return compute_wf_kernel(_nan_if_none(pH), _nan_if_none(clay_pct), annual_rain, mean_temp, particle_size_mm)
 
-    # base_rate derived from literature-style tuning (Beerling-like kinetics simplified)
-    base_rate = 0.18  # baseline max fraction for well-conditioned parameters
-    wf = base_rate * pf * phf * cf * climf
+def make_wf_kernel(particle_size_mm):
+    """
+    WF kernel specialised for one particle size: the particle factor and base rate
+    are frozen into the compiled code as a single constant. Each call compiles;
+    only used for SPECIALISED_SIZES at import, never with request input.
+    """
+    base = BASE_RATE * particle_factor(particle_size_mm)
 
-    # clamp
-    wf = max(min(wf, 0.35), 0.005)  # min 0.5% to avoid zero; max 35%
-    return wf
+    @njit("f8(f8,f8,f8,f8)", fastmath=FASTMATH)
+    def kernel(pH, clay, rain, temp):
+        return _wf_from_base(base, pH, clay, rain, temp)
 
-def co2_per_kg_basalt():
-    # chemically defensible central: 0.33 kg CO2 per kg basalt (depends on CaO+MgO content)
-    return 0.33
+    return kernel
 
-def compute_co2_removal_kg(basalt_mass_kg, wf):
-    return basalt_mass_kg * co2_per_kg_basalt() * wf
+# fixed deployment particle sizes (mm) that get a pre-compiled specialised kernel
+SPECIALISED_SIZES = (0.25,)
+WF_KERNELS = {size: make_wf_kernel(size) for size in SPECIALISED_SIZES}
+
+def wf_for_size(pH, clay_pct, annual_rain, mean_temp, particle_size_mm):
+    """
+    Same contract as compute_weathering_fraction (None pH/clay -> default factors),
+    using the pre-compiled specialised kernel when the size has one.
+    """
+    kernel = WF_KERNELS.get(particle_size_mm)
+    if kernel is None:
+        return compute_weathering_fraction(pH, clay_pct, annual_rain, mean_temp, particle_size_mm)
+    return kernel(_nan_if_none(pH), _nan_if_none(clay_pct), annual_rain, mean_temp)
 
-def conservative_band(value):
-    return value * 0.8
+def compute_weathering_fraction_ctx(soil: SoilContext, particle_size_mm: float):
+    # SoilContext adapter for external callers
+    return compute_weathering_fraction(soil.pH, soil.clay_pct, soil.annual_rain, soil.mean_temp, particle_size_mm)
 
-def optimistic_band(value):
-    return value * 1.15
+def compute_wf_batch(arrs):
+    """
+    WF for many applications at once from column arrays keyed pH/clay/rain/temp/size
+    (NaN for unknown pH/clay).
+    """
+    cols = [np.ascontiguousarray(arrs[k], dtype=np.float64) for k in ("pH", "clay", "rain", "temp", "size")]
+    with np.errstate(invalid="ignore"):
+        return wf_ufunc(*cols)
+
+@njit("f8(f8,f8)", cache=True, fastmath=FASTMATH)
+def compute_co2_removal_kg(basalt_mass_kg, wf):
+    return basalt_mass_kg * CO2_PER_KG * wf
 
+def co2_uncertainty_band(basalt_mass_kg, pH, clay, rain, temp, particle_size_mm,
+                         n=10000, seed=0, pH_sd=0.3, clay_rel=0.1, rain_rel=0.15, temp_sd=1.0, size_rel=0.1):
+    """
+    Monte Carlo 10th/50th/90th percentile CO2 removal (kg) under perturbed inputs.
+    Seeded so audit re-runs reproduce the same band; unknown pH/clay may be None.
+    """
+    rng = np.random.default_rng(seed)
+    pH_s = _nan_if_none(pH) + rng.normal(0.0, pH_sd, n)
+    clay_s = _nan_if_none(clay) * rng.normal(1.0, clay_rel, n)
+    rain_s = rain * rng.normal(1.0, rain_rel, n)
+    temp_s = temp + rng.normal(0.0, temp_sd, n)
+    size_s = particle_size_mm * rng.normal(1.0, size_rel, n)
+    with np.errstate(invalid="ignore"):  # NaN "unknown" inputs are expected here
+        wf = wf_ufunc(pH_s, clay_s, rain_s, temp_s, size_s)
+    # CO2 is a positive scaling of WF, so take the WF quantiles and convert those
+    return np.array([compute_co2_removal_kg(basalt_mass_kg, q) for q in np.quantile(wf, [0.1, 0.5, 0.9])])
+
+@njit("f8(f8,f8)", cache=True, fastmath=FASTMATH)
 def estimate_dic_export(co2_kg, runoff_index):
     # fraction of produced DIC that is exported; conservative 10-40%
     frac = min(max(runoff_index * 0.25, 0.05), 0.4)
     return co2_kg * frac
 
+@njit("f8(f8)", cache=True, fastmath=FASTMATH)
+def slope_from_elevation(elevation_m):
+    # slope proxy (%) from elevation
+    return min(max(elevation_m * 0.005, 0.0), 45.0)
+
+@njit("f8(f8,f8)", cache=True, fastmath=FASTMATH)
+def runoff_index(annual_rain, slope_pct):
+    # simple runoff proxy: (rain/2000) * (slope/10), clamped to [0, 1]
+    return min(max(annual_rain * slope_pct * 5e-5, 0.0), 1.0)
+
+@njit("UniTuple(f8,4)(f8,f8,f8,f8)", cache=True, fastmath=FASTMATH)
+def co2_outputs_kernel(basalt_mass_kg, wf, annual_rain, slope_pct):
+    """
+    Central/conservative/optimistic CO2 and DIC export (kg) in a single compiled call.
+    """
+    co2 = compute_co2_removal_kg(basalt_mass_kg, wf)
+    dic = estimate_dic_export(co2, runoff_index(annual_rain, slope_pct))
+    return co2, co2 * CONS_FACTOR, co2 * OPT_FACTOR, dic
+
 def permanence_score(slope_pct, clay_pct):
     if slope_pct < 3 and (clay_pct is None or clay_pct < 20):
         return "High"
@@ -1,47 +1,153 @@
 # backend/data_sources.py
-import requests
+import httpx
+import asyncio
+import numpy as np
 import math, time
+import logging, queue
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime
+from types import MappingProxyType
+from typing import Final
+from diskcache import Cache
+from .calculations import slope_from_elevation
 
-def safe_get_json(url, params=None, timeout=10):
+# persistent cache of upstream results; keys encode every input that affects the value
+cache = Cache("./cache/env")
+SNAPSHOT_TTL = 30 * 86400   # weather climatology is effectively constant month to month
+SOIL_TTL = 365 * 86400      # SoilGrids does not change on human timescales
+
+# backfill for anything the providers didn't return; shared read-only across requests
+DEFAULTS: Final = MappingProxyType({
+    "annual_rainfall_mm": 1500.0,
+    "mean_temp_c": 22.0,
+    "soil_pH": 6.8,
+    "clay_pct": 18.0,
+    "slope_percent": 5.0,
+    "bulk_density": 1.2,
+    "elevation_m": None
+})
+
+log = logging.getLogger(__name__)
+_log_listener = None
+_log_handler = None
+LOG_THROTTLE_S = 60.0
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+class _Throttle(logging.Filter):
+    # at most one record per key (upstream host / parse site) per LOG_THROTTLE_S,
+    # so an upstream outage can't flood the queue and stream with one line per request
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._last = {}
+
+    def filter(self, record):
+        key = getattr(record, "throttle_key", record.msg)
+        now = time.monotonic()
+        if now - self._last.get(key, -self.interval) < self.interval:
+            return False
+        self._last[key] = now
+        return True
+
+def start_logging():
+    # records are queued on the request path and written by a background thread
+    global _log_listener, _log_handler
+    if _log_listener is None:
+        q = queue.SimpleQueue()
+        _log_handler = QueueHandler(q)
+        _log_handler.addFilter(_Throttle(LOG_THROTTLE_S))
+        log.addHandler(_log_handler)
+        log.propagate = False
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        _log_listener = QueueListener(q, stream)
+        _log_listener.start()
+
+def stop_logging():
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        _log_listener.stop()
+        log.removeHandler(_log_handler)
+        log.propagate = True
+        _log_listener = None
+        _log_handler = None
+
+# shared keep-alive HTTP/2 client, opened/closed by the FastAPI lifespan
+_client = None
+
+def start_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True, timeout=10.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=25),
+            headers={"User-Agent": "carbon-mrv/1.0"}
+        )
+    return _client
+
+def get_http_client():
+    # FastAPI dependency form of the shared client
+    return start_client()
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def safe_get_json(client, url, params=None):
     try:
-        r = requests.get(url, params=params, timeout=timeout)
+        r = await client.get(url, params=params)
         r.raise_for_status()
         return r.json()
     except Exception as e:
-        print(f"[data_sources] fetch failed for {url} : {e}")
+        log.warning("fetch failed for %s: %s", url, e, extra={"throttle_key": httpx.URL(url).host})
         return None
 
-# NASA POWER daily averages (long period) -> returns mean temp & annual precip estimate
-def fetch_weather_nasa_power(lat, lon, start_date="20240101", end_date="20241231"):
-    url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+POWER_FILL = -999.0   # NASA POWER's missing-value marker
+
+def _mean(values):
+    # float mean ignoring missing (None/NaN/POWER fill) entries; None when nothing is left
+    arr = np.asarray(values, dtype=np.float64)   # None -> NaN
+    arr = arr[~np.isnan(arr) & (arr != POWER_FILL)]
+    return float(arr.mean()) if arr.size else None
+
+def _power_annual(param):
+    # POWER climatology already returns the annual value as ANN; fall back to the
+    # mean of the valid monthly values when ANN is missing or a fill value
+    ann = _mean([param.get("ANN")])
+    if ann is not None:
+        return ann
+    return _mean([v for k, v in param.items() if k != "ANN"])
+
+# NASA POWER monthly climatology -> returns mean temp & annual precip estimate
+async def fetch_weather_nasa_power(client, lat, lon):
+    # climatology gives 12 monthly means (+ANN) instead of 365 daily values
+    url = "https://power.larc.nasa.gov/api/temporal/climatology/point"
     params = {
         "parameters": "T2M,PRECTOT",
         "community": "AG",
         "longitude": lon,
         "latitude": lat,
-        "start": start_date,
-        "end": end_date,
         "format": "JSON"
     }
-    r = safe_get_json(url, params)
+    r = await safe_get_json(client, url, params)
     if not r:
         return None
     try:
         t2m = r["properties"]["parameter"].get("T2M", {})
         pr = r["properties"]["parameter"].get("PRECTOT", {})
-        temps = list(t2m.values())
-        rains = list(pr.values())
-        avg_temp = sum(temps)/len(temps) if temps else None
-        # NASA PRECTOT is mm/day totals — convert to approximate annual mm
-        avg_daily_rain = sum(rains)/len(rains) if rains else None
+        avg_temp = _power_annual(t2m)
+        # NASA PRECTOT is mm/day — convert to approximate annual mm
+        avg_daily_rain = _power_annual(pr)
         annual_rain = avg_daily_rain * 365.0 if avg_daily_rain is not None else None
         return {"mean_temp_c": avg_temp, "annual_rainfall_mm": annual_rain, "raw": r}
     except Exception as e:
-        print("[fetch_weather_nasa_power] parse error", e)
+        log.warning("fetch_weather_nasa_power parse error: %s", e)
         return None
 
 # Open-Meteo fallback
-def fetch_weather_open_meteo(lat, lon):
+async def fetch_weather_open_meteo(client, lat, lon):
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
         "latitude": lat,
@@ -50,20 +156,41 @@ def fetch_weather_open_meteo(lat, lon):
         "start_date": "2024-01-01",
         "end_date": "2024-12-31"
     }
-    r = safe_get_json(url, params)
+    r = await safe_get_json(client, url, params)
     if not r:
         return None
     try:
         temps = r.get("hourly", {}).get("temperature_2m", [])
         precs = r.get("hourly", {}).get("precipitation", [])
-        avg_temp = sum(temps)/len(temps) if temps else None
+        avg_temp = _mean(temps)
         # convert hourly precip (mm) to approximate annual (sum over hours -> mm), but arrays can be large
-        avg_hourly = sum(precs)/len(precs) if precs else None
+        avg_hourly = _mean(precs)
         annual_rain = avg_hourly * 24.0 * 365.0 if avg_hourly is not None else None
         return {"mean_temp_c": avg_temp, "annual_rainfall_mm": annual_rain, "raw": r}
     except Exception as e:
-        print("[fetch_weather_open_meteo] parse error", e)
+        log.warning("fetch_weather_open_meteo parse error: %s", e)
+        return None
+
+def depth_weighted(entries, depth_target_cm):
+    """
+    Thickness-weighted mean of (value, thickness) layers, truncated at depth_target_cm.
+    Layers are taken in the order SoilGrids returns them (top down).
+    """
+    if not entries:
+        return None
+    arr = np.array(entries, dtype=np.float64)
+    arr = arr[arr[:, 1] > 0]
+    if not arr.size:
+        return None
+    cum = np.cumsum(arr[:, 1])
+    # first layer reaching the target depth; the rest are ignored
+    i = min(int(np.searchsorted(cum, depth_target_cm)), len(cum) - 1)
+    th = arr[:i+1, 1].copy()
+    th[i] = min(th[i], depth_target_cm - (cum[i-1] if i else 0.0))
+    tot_w = th.sum()
+    if tot_w <= 0:
         return None
+    return float(np.dot(arr[:i+1, 0], th) / tot_w)
 
 # SoilGrids robust parser with depth-weighted 0-30cm extraction and unit conversion
 def parse_soilgrids_depth_weighted(r, depth_target_cm=30):
@@ -98,25 +225,9 @@ def parse_soilgrids_depth_weighted(r, depth_target_cm=30):
             if "bdod" in name or "bulk" in name:
                 bd_entries.append((mean_val, thickness))
 
-    def depth_weighted(arr):
-        if not arr:
-            return None
-        tot_w = 0.0; tot_v = 0.0
-        for val, th in arr:
-            if tot_w >= depth_target_cm:
-                break
-            use = min(th, depth_target_cm - tot_w) if th else 0
-            if use <= 0:
-                continue
-            tot_v += val * use
-            tot_w += use
-        if tot_w == 0:
-            return None
-        return tot_v / tot_w
-
-    ph_raw = depth_weighted(ph_entries)
-    clay_raw = depth_weighted(clay_entries)
-    bd_raw = depth_weighted(bd_entries)
+    ph_raw, clay_raw, bd_raw = (
+        depth_weighted(entries, depth_target_cm) for entries in (ph_entries, clay_entries, bd_entries)
+    )
 
     # Unit conversions (SoilGrids uses scaled units):
     # phh2o often returned as pH*10
@@ -128,69 +239,78 @@ def parse_soilgrids_depth_weighted(r, depth_target_cm=30):
 
     return {"soil_pH": soil_pH, "clay_pct": clay_pct, "bulk_density": bulk_density, "raw": r}
 
-def fetch_soil_soilgrids(lat, lon):
+async def fetch_soil_soilgrids(client, lat, lon):
+    key = f"soil:{round(lat,3)}:{round(lon,3)}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}&property=phh2o&property=clay&property=bdod&value=mean"
-    r = safe_get_json(url)
+    r = await safe_get_json(client, url)
     if not r:
         return None
     parsed = parse_soilgrids_depth_weighted(r)
+    cache.set(key, parsed, expire=SOIL_TTL)
     return parsed
 
-def fetch_elevation_opentopodata(lat, lon):
+async def fetch_elevation_opentopodata(client, lat, lon):
     url = "https://api.opentopodata.org/v1/eudem25m"
     params = {"locations": f"{lat},{lon}"}
-    r = safe_get_json(url, params)
+    r = await safe_get_json(client, url, params)
     if not r:
         return None
     try:
         elev = r["results"][0]["elevation"]
         return {"elevation_m": elev, "raw": r}
     except Exception as e:
-        print("[fetch_elevation_opentopodata] parse error", e)
+        log.warning("fetch_elevation_opentopodata parse error: %s", e)
         return None
 
-def fetch_environment_snapshot(lat, lon):
+async def fetch_environment_snapshot(client, lat, lon):
+    key = f"env:{round(lat,3)}:{round(lon,3)}:{datetime.utcnow():%Y%m}"
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
     out = {}
-    w = fetch_weather_nasa_power(lat, lon)
+    # the three providers are independent -> overlap the round trips
+    w, s, e = await asyncio.gather(
+        fetch_weather_nasa_power(client, lat, lon),
+        fetch_soil_soilgrids(client, lat, lon),
+        fetch_elevation_opentopodata(client, lat, lon),
+        return_exceptions=True
+    )
+    if isinstance(w, Exception):
+        w = None
+    if isinstance(s, Exception):
+        s = None
+    if isinstance(e, Exception):
+        e = None
+
+    if not w:
+        w = await fetch_weather_open_meteo(client, lat, lon)
     if w:
         out["mean_temp_c"] = w.get("mean_temp_c")
         out["annual_rainfall_mm"] = w.get("annual_rainfall_mm")
         out["weather_raw"] = w.get("raw")
-    else:
-        w2 = fetch_weather_open_meteo(lat, lon)
-        if w2:
-            out["mean_temp_c"] = w2.get("mean_temp_c")
-            out["annual_rainfall_mm"] = w2.get("annual_rainfall_mm")
-            out["weather_raw"] = w2.get("raw")
-
-    s = fetch_soil_soilgrids(lat, lon)
+
     if s:
         out["soil_pH"] = s.get("soil_pH")
         out["clay_pct"] = s.get("clay_pct")
         out["bulk_density"] = s.get("bulk_density")
         out["soil_raw"] = s.get("raw")
 
-    e = fetch_elevation_opentopodata(lat, lon)
     if e:
         out["elevation_m"] = e.get("elevation_m")
         out["elev_raw"] = e.get("raw")
 
     # slope proxy
     if out.get("elevation_m") is not None:
-        out["slope_percent"] = min(max((out["elevation_m"]/1000.0)*5.0, 0.0), 45.0)
+        out["slope_percent"] = slope_from_elevation(out["elevation_m"])
 
     # defaults
-    defaults = {
-        "annual_rainfall_mm": 1500.0,
-        "mean_temp_c": 22.0,
-        "soil_pH": 6.8,
-        "clay_pct": 18.0,
-        "slope_percent": 5.0,
-        "bulk_density": 1.2,
-        "elevation_m": None
-    }
-    for k,v in defaults.items():
-        if k not in out or out.get(k) is None:
-            out[k] = v
+    out = {**DEFAULTS, **{k: v for k, v in out.items() if v is not None}}
 
+    # don't pin a defaults-filled snapshot for a month when a provider was down
+    if w and s and e:
+        cache.set(key, out, expire=SNAPSHOT_TTL)
     return out
@@ -1,23 +1,53 @@
 # backend/main.py
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from sqlalchemy import select, insert, bindparam
+from sqlalchemy.orm import Session
 from typing import Optional
-import uuid, datetime, json, hashlib, os
+from contextlib import asynccontextmanager
+import httpx
+import uuid, datetime, hashlib, os
+import orjson
+import aiofiles
 
-from .database import Base, engine, SessionLocal
+from .database import Base, engine, SessionLocal, add_missing_columns
 from .models import Farm, Application
 from .routers import ndvi, weather, logs
 
-from .data_sources import fetch_environment_snapshot
-from .calculations import SoilContext, compute_weathering_fraction, compute_co2_removal_kg, conservative_band, optimistic_band, estimate_dic_export, permanence_score
+from .data_sources import fetch_environment_snapshot, start_client, close_client, get_http_client, start_logging, stop_logging
+from .calculations import wf_for_size, co2_outputs_kernel, permanence_score
+
+# prebuilt hasher; copying it per request skips the OpenSSL context setup
+_SHA256 = hashlib.sha256()
+# stored with every result so verifiers know how the audit payload was serialised;
+# results without it (pre-orjson rows) were hashed over stdlib json.dumps(sort_keys=True, separators=(',',':'))
+AUDIT_ENCODING = "orjson-sortkeys-v1"
 
 # create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+
+PHOTO_CHUNK = 1 << 20
+
+# hot-path statements built once; SQLAlchemy reuses their compiled form from its cache
+select_farm_stmt = select(Farm.id, Farm.name, Farm.geojson).where(Farm.id == bindparam("fid"))
+select_app_stmt = select(Application.__table__).where(Application.id == bindparam("aid"))
+insert_farm_stmt = insert(Farm)
+insert_app_stmt = insert(Application)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging()
+    start_client()
+    yield
+    await close_client()
+    stop_logging()
 
-app = FastAPI(title="Mini-Feluda Local MRV (Beerling-style)")
+app = FastAPI(title="Mini-Feluda Local MRV (Beerling-style)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,29 +73,39 @@ app.include_router(ndvi.router)
 app.include_router(weather.router)
 app.include_router(logs.router)
 
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _get_farm_row(db: Session, farm_id: str):
+    return db.execute(select_farm_stmt, {"fid": farm_id}).first()
+
+def _save_application(db: Session, row: dict):
+    db.execute(insert_app_stmt, row)
+    db.commit()
+
 class FarmIn(BaseModel):
     name: Optional[str]
     geojson: dict
 
 @app.post('/api/farms')
-async def create_farm(payload: FarmIn):
-    db = SessionLocal()
+def create_farm(payload: FarmIn, db: Session = Depends(get_db)):
     farm_id = str(uuid.uuid4())
-    farm = Farm(id=farm_id, name=payload.name or 'Farm-'+farm_id[:6], geojson=json.dumps(payload.geojson))
-    db.add(farm)
+    db.execute(insert_farm_stmt, {
+        "id": farm_id, "name": payload.name or 'Farm-'+farm_id[:6], "geojson": orjson.dumps(payload.geojson).decode()
+    })
     db.commit()
-    db.refresh(farm)
-    db.close()
     return {"farm_id": farm_id}
 
 @app.get('/api/farms/{farm_id}')
-async def get_farm(farm_id: str):
-    db = SessionLocal()
-    farm = db.query(Farm).filter(Farm.id==farm_id).first()
-    db.close()
+def get_farm(farm_id: str, db: Session = Depends(get_db)):
+    farm = _get_farm_row(db, farm_id)
     if not farm:
         raise HTTPException(status_code=404, detail='Farm not found')
-    return {"farm_id": farm.id, "name": farm.name, "geojson": json.loads(farm.geojson)}
+    return {"farm_id": farm.id, "name": farm.name, "geojson": orjson.loads(farm.geojson)}
 
 @app.post('/api/applications')
 async def create_application(
@@ -75,66 +115,50 @@ async def create_application(
     particle_size_mm: float = Form(...),
     lat: float = Form(...),
     lon: float = Form(...),
-    photo: Optional[UploadFile] = File(None)
+    photo: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
-    db = SessionLocal()
-    farm = db.query(Farm).filter(Farm.id==farm_id).first()
+    # sync session work stays off the event loop
+    farm = await run_in_threadpool(_get_farm_row, db, farm_id)
     if not farm:
-        db.close()
         raise HTTPException(status_code=404, detail='Farm not found')
 
     app_id = str(uuid.uuid4())
-    applied_dt = datetime.datetime.fromisoformat(applied_at.replace("Z", "+00:00"))
-
+    # SQLite DateTime persists naive values; hash exactly what gets stored
+    applied_dt = datetime.datetime.fromisoformat(applied_at.replace("Z", "+00:00")).replace(tzinfo=None)
 
     photo_filename = None
+    photo_hash = None
     if photo:
         uploads_dir = os.path.join(os.getcwd(), 'uploads')
         os.makedirs(uploads_dir, exist_ok=True)
         photo_filename = f"{app_id}_{photo.filename}"
-        with open(os.path.join(uploads_dir, photo_filename), 'wb') as f:
-            f.write(await photo.read())
-
-    app_row = Application(
-        id=app_id, farm_id=farm_id, applied_at=applied_dt,
-        basalt_mass_kg=basalt_mass_kg, particle_size_mm=particle_size_mm,
-        lat=lat, lon=lon, photo_filename=photo_filename
-    )
-    db.add(app_row)
-    db.commit()
-    db.refresh(app_row)
+        # stream to disk in chunks, hashing as we go (single pass, O(chunk) memory)
+        ph = _SHA256.copy()
+        async with aiofiles.open(os.path.join(uploads_dir, photo_filename), 'wb') as f:
+            while chunk := await photo.read(PHOTO_CHUNK):
+                ph.update(chunk)
+                await f.write(chunk)
+        photo_hash = ph.hexdigest()
 
     # --- fetch authoritative environment snapshot ---
-    env = fetch_environment_snapshot(lat, lon)
+    env = await fetch_environment_snapshot(client, lat, lon)
 
     # ensure correct types & units (data_sources returns already converted depth-weighted values)
     soil_pH = env.get("soil_pH")
     clay_pct = env.get("clay_pct")
-    bulk_density = env.get("bulk_density")
     annual_rain = env.get("annual_rainfall_mm")
     mean_temp = env.get("mean_temp_c")
     slope_pct = env.get("slope_percent", 5.0)
 
-    # Build soil context
-    soil = SoilContext(
-        pH=soil_pH,
-        clay_pct=clay_pct,
-        bulk_density=bulk_density,
-        annual_rain=annual_rain,
-        mean_temp=mean_temp
-    )
-
     # Weathering fraction (Beerling-style simplified)
-    wf = compute_weathering_fraction(soil, particle_size_mm)
+    wf = wf_for_size(soil_pH, clay_pct, annual_rain, mean_temp, particle_size_mm)
 
-    # CO2 removal (kg)
-    co2_kg = compute_co2_removal_kg(basalt_mass_kg, wf)
-    conservative_kg = conservative_band(co2_kg)
-    optimistic_kg = optimistic_band(co2_kg)
-
-    # Runoff / DIC export estimate (use simple runoff proxy)
-    runoff_index = min(max((annual_rain / 2000.0) * (slope_pct / 10.0), 0.0), 1.0)
-    dic_export_kg = estimate_dic_export(co2_kg, runoff_index)
+    # CO2 removal (kg) with bands, plus runoff proxy / DIC export estimate
+    co2_kg, conservative_kg, optimistic_kg, dic_export_kg = co2_outputs_kernel(
+        basalt_mass_kg, wf, annual_rain, slope_pct
+    )
 
     perm = permanence_score(slope_pct, clay_pct)
 
@@ -149,37 +173,42 @@ async def create_application(
         "env_snapshot": env
     }
 
-    # canonical JSON for audit (include input params)
-    canonical = json.dumps({
-        "application_id": app_row.id,
-        "farm_id": app_row.farm_id,
-        "applied_at": app_row.applied_at.isoformat() if app_row.applied_at else None,
-        "basalt_mass_kg": app_row.basalt_mass_kg,
-        "particle_size_mm": app_row.particle_size_mm,
+    # canonical JSON for audit (include input params). The canonical encoding is
+    # orjson.dumps(..., option=orjson.OPT_SORT_KEYS): compact, UTF-8, sorted keys.
+    # Its float text is not stdlib json's (orjson writes 0.00001 / 1e16 where
+    # json.dumps writes 1e-05 / 1e+16); recorded as result["audit_encoding"].
+    canonical = orjson.dumps({
+        "application_id": app_id,
+        "farm_id": farm_id,
+        "applied_at": applied_dt.isoformat(),
+        "basalt_mass_kg": basalt_mass_kg,
+        "particle_size_mm": particle_size_mm,
         "wf": wf,
         "central_co2_t": result["central_co2_t"]
-    }, sort_keys=True, separators=(',',':'))
+    }, option=orjson.OPT_SORT_KEYS)
 
-    audit_hash = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    h = _SHA256.copy()
+    h.update(canonical)
+    audit_hash = h.hexdigest()
     result["audit_hash"] = audit_hash
+    result["audit_encoding"] = AUDIT_ENCODING
 
-    # save result
-    app_row.audit_hash = audit_hash
-    app_row.result_json = json.dumps(result)
-    db.add(app_row)
-    db.commit()
-    db.refresh(app_row)
-    db.close()
+    # save inputs + result in a single transaction
+    await run_in_threadpool(_save_application, db, {
+        "id": app_id, "farm_id": farm_id, "applied_at": applied_dt,
+        "basalt_mass_kg": basalt_mass_kg, "particle_size_mm": particle_size_mm,
+        "lat": lat, "lon": lon, "photo_filename": photo_filename, "photo_hash": photo_hash,
+        "audit_hash": audit_hash, "result_blob": orjson.dumps(result)
+    })
 
     return {"application_id": app_id, "result": result}
 
 @app.get('/api/applications/{app_id}')
-async def get_application(app_id: str):
-    db = SessionLocal()
-    app_row = db.query(Application).filter(Application.id==app_id).first()
-    db.close()
+def get_application(app_id: str, db: Session = Depends(get_db)):
+    app_row = db.execute(select_app_stmt, {"aid": app_id}).first()
     if not app_row:
         raise HTTPException(status_code=404, detail='Application not found')
+    raw_result = app_row.result_blob or app_row.result_json   # pre-blob rows only have result_json
     return {
         "application_id": app_row.id,
         "farm_id": app_row.farm_id,
@@ -189,6 +218,7 @@ async def get_application(app_id: str):
         "lat": app_row.lat,
         "lon": app_row.lon,
         "photo_filename": app_row.photo_filename,
-        "result": json.loads(app_row.result_json) if app_row.result_json else None,
+        "photo_hash": app_row.photo_hash,
+        "result": orjson.loads(raw_result) if raw_result else None,
         "audit_hash": app_row.audit_hash
     }
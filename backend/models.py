@@ -1,5 +1,5 @@
 # backend/models.py
-from sqlalchemy import Column, String, Float, DateTime, Integer, Text
+from sqlalchemy import Column, String, Float, DateTime, Integer, Text, LargeBinary
 from datetime import datetime
 from .database import Base
 
@@ -20,7 +20,9 @@ class Application(Base):
     lat = Column(Float)
     lon = Column(Float)
     photo_filename = Column(String, nullable=True)
-    result_json = Column(Text, nullable=True)
+    photo_hash = Column(String, nullable=True)   # sha256 of the uploaded photo bytes
+    result_blob = Column(LargeBinary, nullable=True)   # orjson-encoded result
+    result_json = Column(Text, nullable=True)          # legacy rows only; read as fallback
     audit_hash = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -1,5 +1,7 @@
 # backend/routers/logs.py
 from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from ..models import FieldLog
@@ -13,10 +15,20 @@ def get_db():
     finally:
         db.close()
 
+class LogIn(BaseModel):
+    field_id: str
+    note: str
+
 @router.post("/add")
 def add_log(field_id: str, note: str, db: Session = Depends(get_db)):
     new_log = FieldLog(field_id=field_id, note=note)
     db.add(new_log)
     db.commit()
-    db.refresh(new_log)
     return {"status": "saved", "log": new_log.note}
+
+@router.post("/add_many")
+def add_logs(items: list[LogIn], db: Session = Depends(get_db)):
+    if items:
+        db.execute(insert(FieldLog), [x.model_dump() for x in items])
+        db.commit()
+    return {"status": "saved", "count": len(items)}
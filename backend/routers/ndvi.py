@@ -1,5 +1,6 @@
 # backend/routers/ndvi.py
 from fastapi import APIRouter, Depends
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from random import uniform
 from ..database import SessionLocal
@@ -20,5 +21,12 @@ def fetch_ndvi(field_id: str, db: Session = Depends(get_db)):
     record = NDVIRecord(field_id=field_id, ndvi=ndvi_value)
     db.add(record)
     db.commit()
-    db.refresh(record)
     return {"field_id": field_id, "ndvi": ndvi_value}
+
+@router.post("/fetch_batch")
+def fetch_ndvi_batch(field_ids: list[str], db: Session = Depends(get_db)):
+    rows = [{"field_id": fid, "ndvi": round(uniform(0.2, 0.9), 3)} for fid in field_ids]
+    if rows:
+        db.execute(insert(NDVIRecord), rows)
+        db.commit()
+    return rows
@@ -1,12 +1,18 @@
 # backend/routers/weather.py
-import requests
+import time
+import httpx
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from ..models import WeatherRecord
+from ..data_sources import get_http_client
 
 router = APIRouter(prefix="/weather", tags=["Weather"])
 
+WEATHER_TTL = 600  # seconds; repeat polls for the same spot inside a window reuse the reading
+_recent = {}
+
 def get_db():
     db = SessionLocal()
     try:
@@ -14,16 +20,34 @@ def get_db():
     finally:
         db.close()
 
-@router.get("/fetch")
-def fetch_weather(field_id: str, lat: float, lon: float, db: Session = Depends(get_db)):
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&hourly=temperature_2m,precipitation"
-    r = requests.get(url, timeout=10).json()
-    temp_series = r.get("hourly", {}).get("temperature_2m", [])
-    precip_series = r.get("hourly", {}).get("precipitation", [])
-    temperature = temp_series[0] if temp_series else None
-    rainfall = precip_series[0] if precip_series else None
+def _save_reading(db: Session, field_id: str, temperature, rainfall):
     record = WeatherRecord(field_id=field_id, temperature=temperature or 0.0, rainfall=rainfall or 0.0)
     db.add(record)
     db.commit()
-    db.refresh(record)
+
+@router.get("/fetch")
+async def fetch_weather(field_id: str, lat: float, lon: float, db: Session = Depends(get_db),
+                        client: httpx.AsyncClient = Depends(get_http_client)):
+    bucket = int(time.time()) // WEATHER_TTL
+    key = (round(lat, 2), round(lon, 2), bucket)
+    reading = _recent.get(key)
+    if reading is None:
+        url = "https://api.open-meteo.com/v1/forecast"
+        params = {"latitude": lat, "longitude": lon, "hourly": "temperature_2m,precipitation", "forecast_days": 1}
+        resp = await client.get(url, params=params)
+        r = resp.json() if resp.is_success else {}
+        temp_series = r.get("hourly", {}).get("temperature_2m", [])
+        precip_series = r.get("hourly", {}).get("precipitation", [])
+        temperature = temp_series[0] if temp_series else None
+        rainfall = precip_series[0] if precip_series else None
+        reading = (temperature, rainfall)
+        # only memoise real readings; a failed upstream call is retried next poll
+        if reading != (None, None):
+            # drop readings from earlier windows before adding the new one
+            for k in [k for k in _recent if k[2] != bucket]:
+                del _recent[k]
+            _recent[key] = reading
+    temperature, rainfall = reading
+    # sync session work stays off the event loop
+    await run_in_threadpool(_save_reading, db, field_id, temperature, rainfall)
     return {"field_id": field_id, "temp": temperature, "rainfall": rainfall}
@@ -0,0 +1,122 @@
+# backend/tests/test_numerics.py
+# Equivalence checks for the vectorised / table-driven rewrites against the
+# original stair-step and loop implementations (reproduced below as references).
+import math
+import random
+
+import numpy as np
+import pytest
+
+from backend.calculations import (
+    pH_factor, clay_factor, compute_wf_kernel, wf_ufunc, compute_weathering_fraction, wf_for_size
+)
+from backend.data_sources import depth_weighted
+
+
+def ref_pH_factor(pH):
+    if pH is None or math.isnan(pH):
+        return 0.8
+    if pH < 5.5:
+        return 0.4
+    if pH < 6.0:
+        return 0.7
+    if pH <= 7.5:
+        return 1.0
+    return 0.85
+
+def ref_clay_factor(clay):
+    if clay is None or math.isnan(clay):
+        return 0.85
+    if clay < 15:
+        return 1.0
+    if clay < 25:
+        return 0.9
+    if clay < 35:
+        return 0.75
+    return 0.6
+
+def ref_wf(pH, clay, rain, temp, size):
+    pf = min(0.25 / max(size, 0.05), 1.0)
+    climf = min(rain / 1500.0, 1.5) * min((temp + 5.0) / 30.0, 1.4)
+    wf = 0.18 * pf * ref_pH_factor(pH) * ref_clay_factor(clay) * climf
+    return max(min(wf, 0.35), 0.005)
+
+def ref_depth_weighted(arr, depth_target_cm):
+    if not arr:
+        return None
+    tot_w = 0.0; tot_v = 0.0
+    for val, th in arr:
+        if tot_w >= depth_target_cm:
+            break
+        use = min(th, depth_target_cm - tot_w) if th else 0
+        if use <= 0:
+            continue
+        tot_v += val * use
+        tot_w += use
+    if tot_w == 0:
+        return None
+    return tot_v / tot_w
+
+def _near(x):
+    return [x, np.nextafter(x, -np.inf), np.nextafter(x, np.inf)]
+
+PH_CASES = [math.nan, -1e300, 0.0, 3.0, 7.55, 7.6, 9.9, 14.0, 1e300] + _near(5.5) + _near(6.0) + _near(7.5)
+CLAY_CASES = [math.nan, -5.0, 0.0, 60.0, 100.0, 1e300] + _near(15.0) + _near(25.0) + _near(35.0)
+
+
+@pytest.mark.parametrize("pH", PH_CASES)
+def test_pH_factor_boundaries(pH):
+    assert pH_factor(pH) == ref_pH_factor(pH)
+
+@pytest.mark.parametrize("clay", CLAY_CASES)
+def test_clay_factor_boundaries(clay):
+    assert clay_factor(clay) == ref_clay_factor(clay)
+
+def _random_inputs(n, seed=0):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(n):
+        cases.append((
+            rng.choice([math.nan, rng.uniform(3.0, 10.0), rng.choice(PH_CASES)]),
+            rng.choice([math.nan, rng.uniform(0.0, 60.0), rng.choice(CLAY_CASES)]),
+            rng.uniform(0.0, 4000.0), rng.uniform(-10.0, 40.0), rng.uniform(0.01, 3.0),
+        ))
+    return cases
+
+def test_compute_wf_kernel_matches_reference():
+    for args in _random_inputs(20000):
+        assert compute_wf_kernel(*args) == ref_wf(*args), args
+
+def test_wf_ufunc_matches_reference():
+    cases = _random_inputs(20000, seed=1)
+    cols = [np.array(c, dtype=np.float64) for c in zip(*cases)]
+    with np.errstate(invalid="ignore"):
+        out = wf_ufunc(*cols)
+    assert out.tolist() == [ref_wf(*args) for args in cases]
+
+@pytest.mark.parametrize("entries,target", [
+    ([], 30),
+    ([(50.0, 0)], 30),
+    ([(50.0, -5), (60.0, 10)], 30),
+    ([(50.0, 5), (60.0, 0), (70.0, 15), (80.0, 15)], 30),
+    ([(50.0, 30), (60.0, 30)], 30),
+    ([(50.0, 5), (60.0, 10)], 30),
+    ([(50.0, 5), (60.0, 10)], 0),
+    ([(50.0, 5), (60.0, 10)], -10),
+])
+def test_depth_weighted_edge_cases(entries, target):
+    assert depth_weighted(entries, target) == ref_depth_weighted(entries, target)
+
+def test_depth_weighted_matches_reference():
+    rng = random.Random(2)
+    for _ in range(20000):
+        entries = [(rng.uniform(0, 100), rng.choice([0, 5, 10, 15, 30, 40, -5])) for _ in range(rng.randint(0, 6))]
+        target = rng.choice([30, 0, 5, 100])
+        a, b = ref_depth_weighted(entries, target), depth_weighted(entries, target)
+        assert (a is None and b is None) or a == pytest.approx(b, rel=1e-12, abs=1e-12), (entries, target)
+
+@pytest.mark.parametrize("size", [0.25, 0.3, 1.0])
+@pytest.mark.parametrize("pH,clay", [(None, None), (None, 20.0), (7.5, None), (6.8, 18.0)])
+def test_wf_for_size_matches_generic_path(size, pH, clay):
+    # specialised and generic kernels share one contract (None -> default factors)
+    assert wf_for_size(pH, clay, 1500.0, 22.0, size) == compute_weathering_fraction(pH, clay, 1500.0, 22.0, size)